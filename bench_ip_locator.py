@@ -0,0 +1,81 @@
+"""Benchmark the offline IP index: load time, memory footprint, lookup rate.
+
+    python bench_ip_locator.py                 # synthetic 500k-range database
+    python bench_ip_locator.py ip_locations.csv
+"""
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from ip_locator import IPLocationIndex
+
+SYNTHETIC_RANGES = 500_000
+LOOKUPS = 200_000
+
+
+def write_synthetic_csv(path, n):
+    rng = random.Random(0)
+    step = 0xFFFFFFFF // n
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        for i in range(n):
+            start = i * step
+            writer.writerow([
+                start, start + step - 1, "XX", "Country", f"Region {i % 500}", f"City {i % 20000}",
+                f"{rng.uniform(-90, 90):.4f}", f"{rng.uniform(-180, 180):.4f}",
+            ])
+
+
+def main():
+    tmp = None
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        tmp = tempfile.NamedTemporaryFile(suffix=".csv", delete=False)
+        tmp.close()
+        path = tmp.name
+        write_synthetic_csv(path, SYNTHETIC_RANGES)
+
+    try:
+        t0 = time.perf_counter()
+        index = IPLocationIndex.from_csv(path)
+        load_s = time.perf_counter() - t0
+        # Second pass for memory only; tracemalloc skews the timing
+        tracemalloc.start()
+        IPLocationIndex.from_csv(path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        sidecar = path + ".bench.idx"
+        index.save(sidecar)
+        t0 = time.perf_counter()
+        IPLocationIndex.load(sidecar)
+        sidecar_s = time.perf_counter() - t0
+        sidecar_bytes = os.path.getsize(sidecar)
+        os.remove(sidecar)
+    finally:
+        if tmp is not None:
+            os.remove(path)
+
+    rng = random.Random(1)
+    ips = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}"
+           for _ in range(LOOKUPS)]
+    t0 = time.perf_counter()
+    hits = sum(1 for ip in ips if index.lookup(ip))
+    lookup_s = time.perf_counter() - t0
+
+    print(f"ranges:        {len(index):,}")
+    print(f"load time:     {load_s:.2f} s")
+    print(f"index size:    {index.nbytes() / 1e6:.1f} MB ({index.nbytes() / max(len(index), 1):.1f} B/range)")
+    print(f"load peak:     {peak / 1e6:.1f} MB")
+    print(f"sidecar load:  {sidecar_s * 1000:.1f} ms ({sidecar_bytes / 1e6:.1f} MB on disk)")
+    print(f"lookups:       {LOOKUPS:,} ({hits:,} hits)")
+    print(f"lookup rate:   {LOOKUPS / lookup_s:,.0f} /s ({lookup_s / LOOKUPS * 1e6:.2f} us each)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""On-disk archive of fetched forecasts.
+
+Every daily/hourly series returned by Open-Meteo is stored as one SQLite row
+per (location, fetch time, kind). The series itself is packed column by
+column into a single blob:
+
+* numbers are scaled to integers (up to 6 decimals), delta-encoded and
+  written as zigzag varints;
+* naive ISO timestamps/dates become minutes (or seconds)/days since the
+  epoch and go through the same delta encoding, so a regular hourly axis
+  costs ~1 byte per point;
+* ``None`` values are tracked in a per-column bitmap;
+* the whole blob is zlib-compressed.
+
+The encoding is lossless: a column is only packed if it decodes back to the
+exact input, otherwise (NaN/inf, timezone-aware timestamps, more precision
+than supported, ...) it is stored as raw JSON. Mixed int/float columns come
+back as equal floats. Each column's byte length is kept in the header so a
+reader can decode only the columns it needs.
+
+Locations are keyed by coordinates rounded to 2 decimals (about 1 km), so a
+history entry that geocodes to slightly different coordinates still finds
+its archive. Once the stored payloads exceed the byte budget, whole fetches
+(daily and hourly together) are dropped oldest first. The database uses
+incremental auto-vacuum so the freed pages are returned to the filesystem;
+the file is the payload budget plus SQLite page and index overhead.
+"""
+import json
+import math
+import sqlite3
+import struct
+import time
+import zlib
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_DATE = date(1970, 1, 1)
+_MAX_DECIMALS = 6
+_TIME_UNITS = {"minute": 60, "second": 1}
+# Readers back off quickly rather than stall a page render behind a writer
+_READ_TIMEOUT = 0.5
+
+
+def location_key(lat, lon):
+    return f"{lat:.2f},{lon:.2f}"
+
+
+# Varint / delta helpers
+def _write_varints(values, out):
+    prev = 0
+    for v in values:
+        delta = v - prev
+        prev = v
+        z = delta * 2 if delta >= 0 else -delta * 2 - 1
+        while z >= 0x80:
+            out.append((z & 0x7F) | 0x80)
+            z >>= 7
+        out.append(z)
+
+
+def _read_varints(buf, pos, n):
+    values = []
+    prev = 0
+    for _ in range(n):
+        z = shift = 0
+        while True:
+            b = buf[pos]
+            pos += 1
+            z |= (b & 0x7F) << shift
+            if b < 0x80:
+                break
+            shift += 7
+        prev += (z >> 1) ^ -(z & 1)
+        values.append(prev)
+    return values, pos
+
+
+def _classify(values):
+    """Return ``(kind, decimals)`` for the non-null values of a column.
+
+    ``kind`` is ``"raw"`` when the column can't be packed exactly.
+    """
+    if not values:
+        return "int", 0
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        floats = [v for v in values if isinstance(v, float)]
+        if not floats:
+            return "int", 0
+        if not all(math.isfinite(v) for v in floats):
+            return "raw", 0
+        for decimals in range(_MAX_DECIMALS + 1):
+            scale = 10 ** decimals
+            if all(round(v * scale) / scale == v for v in floats):
+                return "float", decimals
+        return "raw", 0
+    if all(isinstance(v, str) for v in values):
+        try:
+            parsed = [datetime.fromisoformat(v) for v in values]
+        except ValueError:
+            return "raw", 0
+        if any(dt.tzinfo is not None for dt in parsed):
+            return "raw", 0
+        if all(len(v) == 10 for v in values):
+            return "date", 0
+        if all(dt.second == 0 and dt.microsecond == 0 for dt in parsed):
+            return "minute", 0
+        return "second", 0
+    return "raw", 0
+
+
+def _to_ints(values, kind, decimals):
+    if kind == "int":
+        return values
+    if kind == "float":
+        scale = 10 ** decimals
+        return [round(v * scale) for v in values]
+    if kind == "date":
+        return [(date.fromisoformat(v) - _EPOCH_DATE).days for v in values]
+    unit = _TIME_UNITS[kind]
+    return [int((datetime.fromisoformat(v) - _EPOCH).total_seconds()) // unit for v in values]
+
+
+def _from_ints(ints, kind, decimals):
+    if kind == "int":
+        return ints
+    if kind == "float":
+        scale = 10 ** decimals
+        return [i / scale for i in ints]
+    if kind == "date":
+        return [(_EPOCH_DATE + timedelta(days=i)).isoformat() for i in ints]
+    unit = _TIME_UNITS[kind]
+    timespec = "minutes" if kind == "minute" else "seconds"
+    return [(_EPOCH + timedelta(seconds=i * unit)).isoformat(timespec=timespec) for i in ints]
+
+
+def _pack_column(values):
+    """Return ``(kind, decimals, has_nulls, bytes)`` for one column."""
+    n = len(values)
+    present = [v for v in values if v is not None]
+    kind, decimals = _classify(present)
+    if kind != "raw":
+        ints = _to_ints(present, kind, decimals)
+        # Anything that doesn't survive the round trip exactly is stored raw
+        if _from_ints(ints, kind, decimals) != present:
+            kind = "raw"
+    if kind == "raw":
+        return "raw", 0, False, json.dumps(values, separators=(",", ":")).encode()
+
+    out = bytearray()
+    has_nulls = len(present) != n
+    if has_nulls:
+        mask = bytearray((n + 7) // 8)
+        filled = []
+        last = ints[0] if ints else 0
+        it = iter(ints)
+        for i, v in enumerate(values):
+            if v is None:
+                mask[i >> 3] |= 1 << (i & 7)
+                filled.append(last)
+            else:
+                last = next(it)
+                filled.append(last)
+        out += mask
+        ints = filled
+    _write_varints(ints, out)
+    return kind, decimals, has_nulls, bytes(out)
+
+
+def encode_series(series):
+    """Pack a dict of equal-length lists (an Open-Meteo block) into bytes."""
+    n = len(series.get("time", []))
+    columns = []
+    body = bytearray()
+    for name, values in series.items():
+        if not isinstance(values, list) or len(values) != n:
+            continue
+        kind, decimals, has_nulls, packed = _pack_column(values)
+        body += packed
+        columns.append([name, kind, decimals, has_nulls, len(packed)])
+
+    header = json.dumps({"n": n, "cols": columns}, separators=(",", ":")).encode()
+    return zlib.compress(struct.pack("<I", len(header)) + header + bytes(body), 9)
+
+
+def _unpack_column(buf, n, kind, decimals, has_nulls):
+    if kind == "raw":
+        return json.loads(buf)
+    mask = None
+    pos = 0
+    if has_nulls:
+        pos = (n + 7) // 8
+        mask = buf[:pos]
+    ints, _ = _read_varints(buf, pos, n)
+    values = _from_ints(ints, kind, decimals)
+    if mask is not None:
+        values = [None if mask[i >> 3] & (1 << (i & 7)) else v for i, v in enumerate(values)]
+    return values
+
+
+def decode_series(blob, columns=None):
+    """Unpack a blob from :func:`encode_series`.
+
+    ``columns`` limits decoding to those names; the others are skipped
+    without being parsed.
+    """
+    raw = zlib.decompress(blob)
+    (header_len,) = struct.unpack_from("<I", raw)
+    header = json.loads(raw[4:4 + header_len])
+    n = header["n"]
+    pos = 4 + header_len
+    series = {}
+    for name, kind, decimals, has_nulls, size in header["cols"]:
+        if columns is None or name in columns:
+            series[name] = _unpack_column(raw[pos:pos + size], n, kind, decimals, has_nulls)
+        pos += size
+    return series
+
+
+class ForecastArchive:
+    """SQLite-backed store of encoded forecast series with size-based retention.
+
+    ``max_bytes`` budgets the encoded payloads, not the database file.
+    """
+
+    def __init__(self, path, max_bytes=20 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        conn = sqlite3.connect(self.path)
+        # Only takes effect on a new database; existing ones need a VACUUM
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("VACUUM")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS forecast_archive (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                location TEXT NOT NULL,
+                fetched_at INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_forecast_archive_loc "
+            "ON forecast_archive (location, kind, fetched_at)"
+        )
+        conn.commit(); conn.close()
+
+    def append(self, lat, lon, weather_json, fetched_at=None):
+        """Store the daily/hourly blocks of an Open-Meteo response."""
+        fetched_at = int(fetched_at if fetched_at is not None else time.time())
+        key = location_key(lat, lon)
+        rows = []
+        for kind in ("daily", "hourly"):
+            block = weather_json.get(kind)
+            if block and block.get("time"):
+                payload = encode_series(block)
+                rows.append((key, fetched_at, kind, payload, len(payload)))
+        if not rows:
+            return
+        conn = sqlite3.connect(self.path)
+        conn.executemany(
+            "INSERT INTO forecast_archive (location, fetched_at, kind, payload, size) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        pruned = self._enforce_retention(conn)
+        conn.commit()
+        if pruned:
+            # execute() steps the pragma once (one page); executescript runs it to completion
+            conn.executescript("PRAGMA incremental_vacuum;")
+        conn.close()
+
+    def _enforce_retention(self, conn):
+        """Delete the oldest whole fetches until the payloads fit the budget."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM forecast_archive").fetchone()[0]
+        if total <= self.max_bytes:
+            return False
+        excess = total - self.max_bytes
+        stale = []
+        fetches = conn.execute(
+            "SELECT location, fetched_at, SUM(size) FROM forecast_archive "
+            "GROUP BY location, fetched_at ORDER BY fetched_at, location"
+        )
+        for location, fetched_at, size in fetches:
+            stale.append((location, fetched_at))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM forecast_archive WHERE location=? AND fetched_at=?", stale)
+        return True
+
+    def read(self, lat, lon, kind="daily", since=None, until=None, columns=None, limit=None):
+        """Return archived series for a location as a long DataFrame.
+
+        One row per (fetched_at, time) point, with one column per archived
+        variable. ``since``/``until`` bound the fetch time (epoch seconds),
+        ``limit`` keeps only the most recent fetches and ``columns`` decodes
+        just those variables (``time`` is always included).
+        """
+        query = "SELECT fetched_at, payload FROM forecast_archive WHERE location=? AND kind=?"
+        params = [location_key(lat, lon), kind]
+        if since is not None:
+            query += " AND fetched_at >= ?"
+            params.append(int(since))
+        if until is not None:
+            query += " AND fetched_at <= ?"
+            params.append(int(until))
+        query += " ORDER BY fetched_at DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit))
+
+        conn = sqlite3.connect(self.path, timeout=_READ_TIMEOUT)
+        rows = conn.execute(query, params).fetchall()
+        conn.close()
+        rows.reverse()
+
+        wanted = None if columns is None else {"time", *columns}
+        data = {"fetched_at": []}
+        total = 0
+        for fetched_at, payload in rows:
+            series = decode_series(payload, wanted)
+            n = len(series.get("time", []))
+            if not n:
+                continue
+            data["fetched_at"].extend([fetched_at] * n)
+            for name, values in series.items():
+                # Back-fill variables that earlier fetches didn't have
+                data.setdefault(name, [None] * total).extend(values)
+            total += n
+            for values in data.values():
+                if len(values) < total:
+                    values.extend([None] * (total - len(values)))
+        if not total:
+            return pd.DataFrame()
+        df = pd.DataFrame(data)
+        df["fetched_at"] = pd.to_datetime(df["fetched_at"], unit="s")
+        return df
+
+    def total_bytes(self):
+        conn = sqlite3.connect(self.path, timeout=_READ_TIMEOUT)
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM forecast_archive").fetchone()[0]
+        conn.close(); return total
+
+
+def _self_check():
+    """Round-trip the codec over the cases it special-cases."""
+    hours = [f"2024-03-01T{h:02d}:00" for h in range(13)]
+    cases = [
+        # Negative and mixed-sign deltas, large jumps
+        {"time": hours, "temp": [5.5, -3.2, -40.1, 12.0, 11.9, 0.0, -0.1, 99.9, -99.9, 0.5, 0.4, 1e5, -1e5]},
+        # Null masks at a non-multiple-of-8 length (13), across the byte boundary
+        {"time": hours, "rain": [None, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, None, None, 0.9, 1.0, 1.1, None]},
+        # All-None column and integer codes with negatives
+        {"time": hours, "empty": [None] * 13, "code": [0, 3, -1, 61, 95, 0, 0, 2, 2, -7, 45, 3, 1]},
+        # Dates, and minute vs second resolution timestamps
+        {"time": ["2024-02-28", "2024-02-29", "2024-03-01"],
+         "sunrise": ["2024-02-28T06:59", "2024-02-29T06:57", "2024-03-01T06:55"],
+         "exact": ["2024-02-28T06:59:12", "2024-02-29T06:57:00", "1969-12-31T23:59:59"]},
+        # Columns that must fall back to raw JSON
+        {"time": ["2024-03-01T00:00Z", "2024-03-01T01:00Z"], "nan": [float("inf"), -1.0],
+         "precise": [1.23456789, 2.0], "micro": ["2024-03-01T00:00:00.5", "2024-03-01T00:00:01"],
+         "flags": [True, False], "text": ["a", None]},
+        {"time": []},
+    ]
+    for series in cases:
+        decoded = decode_series(encode_series(series))
+        assert decoded.keys() == series.keys(), (decoded, series)
+        for name, values in series.items():
+            got = decoded[name]
+            assert len(got) == len(values), name
+            for a, b in zip(got, values):
+                same = (a == b) or (isinstance(a, float) and math.isnan(a) and math.isnan(b))
+                assert same and (a is None) == (b is None), (name, got, values)
+
+    # Mixed int/float columns come back as equal floats
+    mixed = {"time": hours[:3], "precip": [0, 0.2, 3]}
+    assert decode_series(encode_series(mixed))["precip"] == [0.0, 0.2, 3.0]
+
+    # Column selection skips everything else
+    assert decode_series(encode_series(cases[2]), columns=["code"]) == {"code": cases[2]["code"]}
+
+
+if __name__ == "__main__":
+    _self_check()
+    print("forecast_archive codec self-check passed")
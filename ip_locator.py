@@ -0,0 +1,216 @@
+"""Offline IP-to-location lookup.
+
+Loads a local IP-range database into parallel sorted arrays and answers
+lookups with a binary search, so locating a visitor never leaves the process.
+
+The CSV layout is the one shared by the IP2Location LITE DB5 and DB-IP City
+Lite downloads (no header row):
+
+    ip_start, ip_end, <col 2>, country, region, city, latitude, longitude
+
+``ip_start``/``ip_end`` may be dotted IPv4 strings or plain integers. IPv6
+rows and placeholder rows for unknown ranges (no labels, 0,0) are skipped.
+
+Parsing a multi-million row CSV takes seconds, so ``IPLocationIndex.open``
+keeps the sorted arrays in a binary sidecar (``<csv>.idx``) next to the CSV
+and reloads that instead while the CSV's size and mtime match the ones
+recorded in the sidecar.
+"""
+import csv
+import ipaddress
+import json
+import os
+import socket
+import sys
+from array import array
+from bisect import bisect_right
+
+
+def _ip_to_int(value):
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        return int.from_bytes(socket.inet_aton(value), "big")
+    except OSError:
+        raise ValueError(value)
+
+
+_COLUMNS = ("starts", "ends", "lats", "lons", "label_ids")
+
+
+class IPLocationIndex:
+    """Sorted IPv4 ranges with their coordinates and a place label.
+
+    Each range costs 20 bytes (two uint32 bounds, two float32 coordinates and
+    a uint32 index into a de-duplicated label list).
+    """
+
+    def __init__(self):
+        self.starts = array("I")
+        self.ends = array("I")
+        self.lats = array("f")
+        self.lons = array("f")
+        self.label_ids = array("I")
+        self.labels = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def from_csv(cls, path):
+        index = cls()
+        label_ids = {}
+        in_order = True
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                if len(row) < 8:
+                    continue
+                try:
+                    start, end = _ip_to_int(row[0]), _ip_to_int(row[1])
+                    lat, lon = float(row[6]), float(row[7])
+                except ValueError:
+                    # Header row, IPv6 range or malformed line
+                    continue
+                if end > 0xFFFFFFFF or start > end:
+                    continue
+                label = next((c for c in (row[5], row[4], row[3]) if c and c != "-"), "")
+                if not label and lat == 0 and lon == 0:
+                    # Unknown/unallocated range ("-" labels at 0,0): not a location
+                    continue
+                label_id = label_ids.get(label)
+                if label_id is None:
+                    label_id = label_ids[label] = len(index.labels)
+                    index.labels.append(label)
+                if index.starts and start < index.starts[-1]:
+                    in_order = False
+                index.starts.append(start)
+                index.ends.append(end)
+                index.lats.append(lat)
+                index.lons.append(lon)
+                index.label_ids.append(label_id)
+
+        # Published databases are already sorted; only reorder when needed
+        if not in_order:
+            order = sorted(range(len(index.starts)), key=index.starts.__getitem__)
+            for name in _COLUMNS:
+                column = getattr(index, name)
+                setattr(index, name, array(column.typecode, (column[i] for i in order)))
+        return index
+
+    @classmethod
+    def open(cls, path):
+        """Load from the binary sidecar when fresh, else parse the CSV and write it."""
+        sidecar = path + ".idx"
+        st = os.stat(path)
+        source = [st.st_size, st.st_mtime_ns]
+        try:
+            return cls.load(sidecar, source=source)
+        except (OSError, ValueError, KeyError, EOFError):
+            # Missing, stale or unreadable sidecar: rebuild it
+            pass
+        index = cls.from_csv(path)
+        try:
+            index.save(sidecar, source=source)
+        except OSError:
+            pass
+        return index
+
+    def save(self, path, source=None):
+        """Write the arrays to ``path``; ``source`` records the CSV's ``[size, mtime_ns]``."""
+        header = {
+            "n": len(self),
+            "byteorder": sys.byteorder,
+            "itemsizes": [getattr(self, name).itemsize for name in _COLUMNS],
+            "source": source,
+        }
+        labels = "\0".join(self.labels).encode("utf-8")
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(json.dumps(header).encode() + b"\n")
+                for name in _COLUMNS:
+                    getattr(self, name).tofile(f)
+                f.write(labels)
+            os.replace(tmp, path)
+        except BaseException:
+            # Don't leave a half-written temp file next to the CSV
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, path, source=None):
+        """Read a sidecar; with ``source``, reject it unless it was built from that CSV."""
+        index = cls()
+        with open(path, "rb") as f:
+            header = json.loads(f.readline())
+            itemsizes = [getattr(index, name).itemsize for name in _COLUMNS]
+            if header["byteorder"] != sys.byteorder or header["itemsizes"] != itemsizes:
+                raise ValueError("index sidecar was written on an incompatible platform")
+            if source is not None and header["source"] != source:
+                raise ValueError("index sidecar is out of date")
+            for name in _COLUMNS:
+                getattr(index, name).fromfile(f, header["n"])
+            labels = f.read().decode("utf-8")
+        index.labels = labels.split("\0") if header["n"] else []
+        return index
+
+    def lookup(self, ip):
+        """Return ``(lat, lon, label)`` for an IPv4 address, or ``None``."""
+        try:
+            key = int.from_bytes(socket.inet_aton(ip.strip()), "big")
+        except (AttributeError, OSError):
+            # Not dotted IPv4; an IPv4-mapped IPv6 address can still match
+            try:
+                mapped = ipaddress.IPv6Address(ip.strip()).ipv4_mapped
+            except (AttributeError, ValueError):
+                return None
+            if mapped is None:
+                return None
+            key = int(mapped)
+        i = bisect_right(self.starts, key) - 1
+        if i < 0 or key > self.ends[i]:
+            return None
+        return float(self.lats[i]), float(self.lons[i]), self.labels[self.label_ids[i]]
+
+    def nbytes(self):
+        """Approximate memory held by the range arrays and label list."""
+        arrays = (self.starts, self.ends, self.lats, self.lons, self.label_ids)
+        return sum(a.itemsize * len(a) for a in arrays) + sum(len(s) for s in self.labels)
+
+
+def client_ip(headers):
+    """Pick the visitor's address from proxy headers.
+
+    ``X-Forwarded-For`` lists the client first, followed by each proxy hop.
+    Private and loopback addresses are skipped so a local proxy never wins.
+    The index only covers IPv4, so the first global IPv4 (or IPv4-mapped)
+    address is preferred over an earlier IPv6 one from a dual-stack proxy.
+    """
+    if not headers:
+        return None
+    candidates = []
+    forwarded = headers.get("X-Forwarded-For")
+    if forwarded:
+        candidates.extend(forwarded.split(","))
+    real_ip = headers.get("X-Real-Ip")
+    if real_ip:
+        candidates.append(real_ip)
+    first_v6 = None
+    for candidate in candidates:
+        try:
+            addr = ipaddress.ip_address(candidate.strip())
+        except ValueError:
+            continue
+        if addr.version == 6 and addr.ipv4_mapped is not None:
+            addr = addr.ipv4_mapped
+        if not addr.is_global:
+            continue
+        if addr.version == 4:
+            return str(addr)
+        if first_v6 is None:
+            first_v6 = str(addr)
+    return first_v6
@@ -9,6 +9,8 @@ import sqlite3, requests
 import os, json
 from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint
 from io import BytesIO
+from ip_locator import IPLocationIndex, client_ip
+from forecast_archive import ForecastArchive
 # from dotenv import load_dotenv
 
 # load_dotenv()
@@ -39,6 +41,10 @@ WEATHERCODE_MAP = {
 
 
 HISTORY_DB = "search_history.db"
+IP_LOCATION_DB = "ip_locations.csv"
+FORECAST_ARCHIVE_DB = "forecast_archive.db"
+TREND_DAYS = 3
+TREND_HOURLY_FETCHES = 24
 
 # Helpers
 def weathercode_to_text(code):
@@ -64,7 +70,12 @@ def reverse_geocode(lat, lon):
     except (GeocoderTimedOut, GeocoderServiceError):
         return None
 
-@st.cache_data(ttl=60*5)
+@st.cache_resource(show_spinner="Loading IP location database...")
+def load_ip_index():
+    if not os.path.exists(IP_LOCATION_DB):
+        return None
+    return IPLocationIndex.open(IP_LOCATION_DB)
+
 def ip_geolocate():
     """Get accurate location from browser GPS, fallback to IP lookup."""
     components.html("""
@@ -96,22 +107,24 @@ def ip_geolocate():
         except Exception:
             pass
 
-    # Fallback: IP-based lookup (use ipwho.is for better coverage)
-    try:
-        r = requests.get("https://ipwho.is/", timeout=6)
-        if r.status_code == 200:
-            j = r.json()
-            if j.get("success"):
-                lat = j.get("latitude")
-                lon = j.get("longitude")
-                city = j.get("city") or j.get("region") or j.get("country") or ""
-                if lat and lon:
-                    return float(lat), float(lon), city
-    except Exception:
-        pass
+    # Fallback: offline IP lookup against the visitor's own address
+    if "client_ip" not in st.session_state:
+        st.session_state["client_ip"] = client_ip(st.context.headers)
+    index = load_ip_index()
+    ip = st.session_state["client_ip"]
+    if index is not None and ip:
+        hit = index.lookup(ip)
+        if hit:
+            lat, lon, city = hit
+            if lat and lon:
+                return lat, lon, city
 
     return None, None, None
 
+@st.cache_resource
+def get_forecast_archive():
+    return ForecastArchive(FORECAST_ARCHIVE_DB)
+
 @st.cache_data(ttl=60*5)
 def fetch_weather(lat, lon, daily_days=5):
     url = "https://api.open-meteo.com/v1/forecast"
@@ -126,7 +139,14 @@ def fetch_weather(lat, lon, daily_days=5):
     }
     r = requests.get(url, params=params, timeout=10)
     r.raise_for_status()
-    return r.json()
+    data = r.json()
+    # Only runs on a cache miss, so each upstream fetch is archived once.
+    # The archive is a side feature and must never break the weather view.
+    try:
+        get_forecast_archive().append(lat, lon, data)
+    except Exception:
+        pass
+    return data
 
 # =========================
 # 2. Geocoding Function
@@ -260,6 +280,37 @@ def handle_city_input(city_text):
     return geo
 
 
+def display_forecast_trend(lat, lon, dates):
+    """Chart archived forecasts for the target dates still in the current forecast."""
+    # Like the write in fetch_weather, an archive problem must never break the weather view
+    try:
+        archive = get_forecast_archive()
+        since = datetime.now().timestamp() - TREND_DAYS * 86400
+        daily = archive.read(lat, lon, kind="daily", since=since, columns=["temperature_2m_max"])
+        if daily.empty:
+            return
+        daily = daily[daily["time"].isin(dates)]
+        if daily["fetched_at"].nunique() < 2:
+            return
+        highs = daily.pivot_table(index="fetched_at", columns="time", values="temperature_2m_max")
+
+        latest = None
+        hourly = archive.read(lat, lon, kind="hourly", since=since, columns=["temperature_2m"], limit=TREND_HOURLY_FETCHES)
+        if not hourly.empty:
+            # Latest forecast for each hour, stitched across the most recent fetches
+            latest = hourly.sort_values("fetched_at").drop_duplicates("time", keep="last")
+            latest = latest.assign(time=pd.to_datetime(latest["time"])).set_index("time").sort_index()
+    except Exception:
+        return
+
+    st.markdown("## Forecast Trend")
+    st.caption(f"How the forecast daily high changed across fetches in the last {TREND_DAYS} days (local archive).")
+    st.line_chart(highs)
+    if latest is not None:
+        st.caption("Hourly temperature, latest forecast per hour.")
+        st.line_chart(latest["temperature_2m"])
+
+
 def display_weather(lat, lon, display_name):
     weather_json = fetch_weather(lat, lon, daily_days=5)
     current = weather_json.get("current_weather", {})
@@ -325,6 +376,8 @@ def display_weather(lat, lon, display_name):
                 st.write(f"Sunrise: {row['sunrise'].split('T')[-1]}")
                 st.write(f"Sunset: {row['sunset'].split('T')[-1]}")
 
+    display_forecast_trend(lat, lon, daily.get("time", []))
+
 
 st.title("🌤️ Weather Update")
 st.markdown("Enter any location or coordinates, then click **Get weather**.")
@@ -627,6 +680,8 @@ if "from_history" in st.session_state:
                 st.write(f"Sunrise: {row['sunrise'].split('T')[-1]}")
                 st.write(f"Sunset: {row['sunset'].split('T')[-1]}")
 
+    display_forecast_trend(lat, lon, daily.get("time", []))
+
     del st.session_state["from_history"]
 
 